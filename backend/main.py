@@ -1,13 +1,15 @@
 import io
 import json
 import os
+import time
 import uuid
 
 import pika
 from fastapi import FastAPI, File, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from minio import Minio
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
 
 app = FastAPI(title="Wildlife Detection API")
 
@@ -29,6 +31,23 @@ BUCKET_NAME = "wildlife-images"
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "rabbitmq")
 QUEUE_NAME = "ai_processing_queue"
 
+# Prometheus Metrics
+STAGE_SECONDS = Histogram(
+    "wildlife_backend_stage_seconds",
+    "Time spent in each stage of handling an upload",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+UPLOADS = Counter(
+    "wildlife_backend_uploads_total",
+    "Files accepted for processing",
+    ["file_type"],
+)
+FAILURES = Counter(
+    "wildlife_backend_failures_total",
+    "Failed uploads",
+)
+
 # Initialize MinIO Client
 minio_client = Minio(
     MINIO_ENDPOINT,
@@ -57,8 +76,14 @@ def read_root():
     return {"message": "Wildlife Detection API is running"}
 
 
+@app.get("/metrics")
+def metrics():
+    """Expose Prometheus metrics."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post("/detect")
-async def detect_wildlife(file: UploadFile = File(...)):
+async def detect_wildlife(file: UploadFile = File(...), full_resolution: bool = False):
     try:
         # Generate unique ID
         task_id = str(uuid.uuid4())
@@ -74,6 +99,7 @@ async def detect_wildlife(file: UploadFile = File(...)):
         file_type = "video" if "video" in content_type else "image"
 
         # Upload to MinIO
+        started = time.perf_counter()
         minio_client.put_object(
             BUCKET_NAME,
             object_name,
@@ -81,15 +107,21 @@ async def detect_wildlife(file: UploadFile = File(...)):
             length=len(content),
             content_type=content_type,
         )
+        STAGE_SECONDS.labels(stage="upload").observe(time.perf_counter() - started)
 
         # Send task to RabbitMQ
+        started = time.perf_counter()
         connection, channel = get_rabbitmq_channel()
         message = {
             "task_id": task_id,
             "object_name": object_name,
             "original_filename": file.filename,
             "file_type": file_type,
+            "enqueued_at": time.time(),  # lets the worker measure queue wait
         }
+        # Only override the worker's ANNOTATE_FULL_RESOLUTION when asked to
+        if full_resolution:
+            message["full_resolution"] = True
         channel.basic_publish(
             exchange="",
             routing_key=QUEUE_NAME,
@@ -99,6 +131,8 @@ async def detect_wildlife(file: UploadFile = File(...)):
             ),
         )
         connection.close()
+        STAGE_SECONDS.labels(stage="enqueue").observe(time.perf_counter() - started)
+        UPLOADS.labels(file_type=file_type).inc()
 
         return {
             "task_id": task_id,
@@ -107,6 +141,7 @@ async def detect_wildlife(file: UploadFile = File(...)):
         }
 
     except Exception as e:
+        FAILURES.inc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
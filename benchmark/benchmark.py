@@ -0,0 +1,706 @@
+"""
+End-to-end benchmark for the upload -> queue -> worker -> result path.
+
+Two modes are supported:
+
+  inmemory  Imports worker/worker.py in-process and replaces MinIO and
+            RabbitMQ with in-memory fakes. With --stub-model the YOLO model
+            is replaced too, so no weights or services are needed.
+
+  http      Drives a running stack (e.g. `docker-compose up`) through the
+            backend API, polling /results until each task completes. Stage
+            timings are taken from the Prometheus /metrics endpoints.
+
+Each concurrency level runs a closed loop of client threads and reports
+throughput, p50/p99 latency, per-stage timings and memory. The report is
+written as JSON so runs can be compared across commits.
+
+Examples:
+
+    python benchmark/benchmark.py --stub-model --concurrency 1,2,4,8
+    python benchmark/benchmark.py --input video --requests 8 --output bench.json
+    python benchmark/benchmark.py --mode http --api-url http://localhost/api \\
+        --worker-metrics-url http://localhost:9100/metrics
+
+Per-stage memory is recorded with tracemalloc, by default only at
+concurrency 1 (see --trace-memory). tracemalloc has a single peak counter
+for the whole process, so a stage's memory is only kept when no other
+stage ran at the same time. For video, inference overlaps reading the
+next group of frames, so some stages may have no memory figure at all.
+Peak RSS is reset before each level on Linux; elsewhere it is the peak
+over the whole process lifetime, as noted by peak_rss_scope in the report.
+
+The inmemory mode does not run backend/main.py, so its "upload" stage is
+only a put into the in-memory store. Backend stages (upload, enqueue) are
+only measured in http mode.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import queue
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import types
+import urllib.request
+import uuid
+from collections import defaultdict
+
+from fakes import FakeChannel, FakeMinio, StubYOLO
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKER_DIR = os.path.join(ROOT_DIR, "worker")
+TEST_DATA_DIR = os.path.join(ROOT_DIR, "Test Data")
+
+INPUTS = {
+    "image": (os.path.join(TEST_DATA_DIR, "zebra-image.jpg"), "image/jpeg"),
+    "video": (os.path.join(TEST_DATA_DIR, "elephant-video.mp4"), "video/mp4"),
+}
+
+
+def percentile(values, pct):
+    """Return the pct-th percentile of values using linear interpolation."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize_ms(values):
+    """Summarize a list of durations in seconds as milliseconds."""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(max(values) * 1000, 3),
+    }
+
+
+def reset_peak_rss():
+    """
+    Reset the kernel's peak RSS counter for this process (Linux only).
+
+    Returns True if the reset worked and peak_rss_kb() is per-level.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KiB."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and KiB on Linux
+    return usage // 1024 if sys.platform == "darwin" else usage
+
+
+def git_commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except Exception:
+        return None
+
+
+def pick_inputs(kind, count):
+    """Return a list of (file_type, path, content_type) for count requests."""
+    kinds = ["image", "video"] if kind == "mixed" else [kind]
+    picked = []
+    for i in range(count):
+        file_type = kinds[i % len(kinds)]
+        path, content_type = INPUTS[file_type]
+        picked.append((file_type, path, content_type))
+    return picked
+
+
+# ---------------------------------------------------------------------------
+# In-memory mode
+# ---------------------------------------------------------------------------
+
+
+class StageRecorder:
+    """
+    Replacement for worker.timed_stage that keeps every duration.
+
+    When trace_memory is set it also records how far traced memory rose
+    above its starting point during each stage. tracemalloc's peak counter
+    is shared by all threads, so a measurement is discarded whenever
+    another stage was running at any point during it. The wrapped
+    timed_stage still runs, so the worker's own metrics and failure
+    tagging keep working.
+    """
+
+    def __init__(self, inner=None):
+        self.inner = inner or (lambda stage: contextlib.nullcontext())
+        self.trace_memory = False
+        self._lock = threading.Lock()
+        self._active = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.durations = defaultdict(list)
+            self.peak_bytes = {}
+            self.memory_samples = defaultdict(int)
+            self.overlapped_samples = defaultdict(int)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.durations[stage].append(seconds)
+
+    @contextlib.contextmanager
+    def timed_stage(self, stage):
+        trace_memory = self.trace_memory
+        if trace_memory:
+            token = object()
+            with self._lock:
+                # Any stage already running overlaps this one, and vice versa
+                overlapped = bool(self._active)
+                for other in self._active:
+                    self._active[other] = True
+                self._active[token] = overlapped
+                start_mem = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            with self.inner(stage):
+                yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.durations[stage].append(elapsed)
+                if trace_memory:
+                    rise = tracemalloc.get_traced_memory()[1] - start_mem
+                    if self._active.pop(token):
+                        self.overlapped_samples[stage] += 1
+                    else:
+                        self.memory_samples[stage] += 1
+                        self.peak_bytes[stage] = max(
+                            self.peak_bytes.get(stage, 0), rise
+                        )
+
+    def summary(self):
+        with self._lock:
+            stages = {}
+            for stage, values in sorted(self.durations.items()):
+                stages[stage] = summarize_ms(values)
+                if self.memory_samples[stage] or self.overlapped_samples[stage]:
+                    peak = self.peak_bytes.get(stage)
+                    stages[stage]["peak_mem_kb"] = (
+                        None if peak is None else peak // 1024
+                    )
+                    stages[stage]["mem_samples"] = self.memory_samples[stage]
+                    stages[stage]["mem_overlapped"] = self.overlapped_samples[stage]
+            return stages
+
+
+def load_worker(args):
+    """Import worker.py with in-memory MinIO and, optionally, a stub model."""
+    os.environ["YOLO_MODEL"] = args.model
+    os.environ["WORKER_CONCURRENCY"] = str(args.worker_concurrency)
+    os.environ["INFERENCE_MAX_BATCH"] = str(args.max_batch)
+    os.environ["INFERENCE_MAX_WAIT_MS"] = str(args.max_wait_ms)
+
+    if args.stub_model:
+        StubYOLO.latency_ms = args.stub_latency_ms
+        StubYOLO.per_frame_ms = args.stub_per_frame_ms
+        sys.modules["ultralytics"] = types.SimpleNamespace(YOLO=StubYOLO)
+
+    sys.path.insert(0, WORKER_DIR)
+    import worker
+
+    worker.minio_client = FakeMinio()
+    return worker
+
+
+def run_inmemory_level(worker, recorder, inputs, concurrency, timeout):
+    """Run one closed-loop concurrency level against the in-process worker."""
+    channel = FakeChannel()
+    broker = queue.Queue()
+    payloads = {path: open(path, "rb").read() for _, path, _ in inputs}
+
+    latencies = []
+    failures = []
+    timed_out = []
+    lock = threading.Lock()
+    work = queue.Queue()
+    for item in inputs:
+        work.put(item)
+
+    def deliver():
+        # Stands in for the pika connection thread dispatching deliveries
+        while True:
+            item = broker.get()
+            if item is None:
+                return
+            method, body = item
+            worker.callback(channel, method, None, body)
+
+    def client():
+        while True:
+            try:
+                file_type, path, content_type = work.get_nowait()
+            except queue.Empty:
+                return
+
+            task_id = str(uuid.uuid4())
+            object_name = f"{task_id}.{path.rsplit('.', 1)[-1]}"
+            content = payloads[path]
+            started = time.perf_counter()
+
+            with recorder.timed_stage("upload"):
+                worker.minio_client.put_object(
+                    worker.BUCKET_NAME,
+                    object_name,
+                    io.BytesIO(content),
+                    length=len(content),
+                    content_type=content_type,
+                )
+
+            tag, pending = channel.register()
+            message = {
+                "task_id": task_id,
+                "object_name": object_name,
+                "original_filename": os.path.basename(path),
+                "file_type": file_type,
+                "enqueued_at": time.time(),
+            }
+            broker.put((types.SimpleNamespace(delivery_tag=tag), json.dumps(message)))
+
+            # A task that never finishes counts as a failure, not a hang
+            finished = pending["event"].wait(timeout)
+            elapsed = time.perf_counter() - started
+            ok = finished and pending["ok"] and worker.minio_client.has_object(
+                worker.BUCKET_NAME, f"results/{task_id}.json"
+            )
+            with lock:
+                (latencies if ok else failures).append(elapsed)
+                if not finished:
+                    timed_out.append(elapsed)
+
+    dispatcher = threading.Thread(target=deliver, daemon=True)
+    dispatcher.start()
+
+    wall_started = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    wall = time.perf_counter() - wall_started
+
+    broker.put(None)
+    dispatcher.join()
+    # Drop stored uploads/results so memory does not grow across levels
+    worker.minio_client.remove_prefix("")
+
+    return latencies, failures, len(timed_out), wall
+
+
+@contextlib.contextmanager
+def quiet(args):
+    """Silence worker and model log output unless --verbose is given."""
+    if args.verbose:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def install_recorder(worker):
+    """Route the worker's stage timings and queue wait through a StageRecorder."""
+    recorder = StageRecorder(worker.timed_stage)
+    worker.timed_stage = recorder.timed_stage
+
+    process_message = worker.process_message
+
+    def timed_process_message(ch, method, body):
+        # Queue wait as the worker sees it: from publishing until a worker
+        # thread starts on the task, including time in the executor queue
+        enqueued_at = json.loads(body)["enqueued_at"]
+        recorder.observe("queue_wait", max(0.0, time.time() - enqueued_at))
+        process_message(ch, method, body)
+
+    worker.process_message = timed_process_message
+    return recorder
+
+
+def run_inmemory(args, inputs):
+    with quiet(args):
+        worker = load_worker(args)
+    recorder = install_recorder(worker)
+
+    levels = []
+    for concurrency in args.concurrency:
+        trace_memory = args.trace_memory == "always" or (
+            args.trace_memory == "auto" and concurrency == 1
+        )
+        if trace_memory:
+            tracemalloc.start()
+        recorder.trace_memory = trace_memory
+        recorder.reset()
+        rss_reset = reset_peak_rss()
+
+        before = worker.scheduler.stats()
+        with quiet(args):
+            latencies, failures, timed_out, wall = run_inmemory_level(
+                worker, recorder, inputs, concurrency, args.timeout
+            )
+        after = worker.scheduler.stats()
+
+        batches = after["batches"] - before["batches"]
+        frames = after["frames"] - before["frames"]
+        level = build_level(concurrency, latencies, failures, wall)
+        level["timed_out"] = timed_out
+        level["stages"] = recorder.summary()
+        level["scheduler"] = {
+            "batches": batches,
+            "frames": frames,
+            "avg_batch_size": round(frames / batches, 2) if batches else 0,
+        }
+        level["peak_rss_kb"] = peak_rss_kb()
+        level["peak_rss_scope"] = "level" if rss_reset else "process"
+        if trace_memory:
+            level["traced_peak_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+            recorder.trace_memory = False
+        levels.append(level)
+        print_level(level)
+
+    return levels
+
+
+# ---------------------------------------------------------------------------
+# HTTP mode
+# ---------------------------------------------------------------------------
+
+
+def post_file(api_url, path, content_type):
+    boundary = uuid.uuid4().hex
+    with open(path, "rb") as f:
+        content = f.read()
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; '
+        f'filename="{os.path.basename(path)}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    request = urllib.request.Request(
+        f"{api_url}/detect",
+        data=body,
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def get_json(url):
+    with urllib.request.urlopen(url) as response:
+        return json.loads(response.read())
+
+
+def scrape_histograms(url):
+    """
+    Fetch a Prometheus text endpoint and collect *_stage_seconds histograms.
+
+    Returns {stage: {"sum": float, "count": float, "buckets": {le: count}}}.
+    """
+    with urllib.request.urlopen(url) as response:
+        text = response.read().decode()
+
+    stages = defaultdict(lambda: {"sum": 0.0, "count": 0.0, "buckets": {}})
+    for line in text.splitlines():
+        if line.startswith("#") or "_stage_seconds" not in line:
+            continue
+        name_labels, value = line.rsplit(" ", 1)
+        if "{" not in name_labels:
+            continue
+        name, labels = name_labels.split("{", 1)
+        labels = dict(
+            part.split("=", 1) for part in labels.rstrip("}").split(",") if part
+        )
+        labels = {key: val.strip('"') for key, val in labels.items()}
+        stage = labels.get("stage")
+        if stage is None:
+            continue
+        if name.endswith("_bucket"):
+            stages[stage]["buckets"][float(labels["le"])] = float(value)
+        elif name.endswith("_sum"):
+            stages[stage]["sum"] = float(value)
+        elif name.endswith("_count"):
+            stages[stage]["count"] = float(value)
+    return dict(stages)
+
+
+def bucket_quantile(buckets, q):
+    """Estimate a quantile from cumulative bucket counts (upper bound)."""
+    if not buckets:
+        return None
+    total = buckets[max(buckets)]
+    if total <= 0:
+        return None
+    for bound in sorted(buckets):
+        if buckets[bound] >= q * total:
+            return bound
+    return None
+
+
+def diff_histograms(before, after):
+    stages = {}
+    for stage, data in after.items():
+        prev = before.get(stage, {"sum": 0.0, "count": 0.0, "buckets": {}})
+        count = data["count"] - prev["count"]
+        if count <= 0:
+            continue
+        buckets = {
+            bound: value - prev["buckets"].get(bound, 0.0)
+            for bound, value in data["buckets"].items()
+        }
+        p50 = bucket_quantile(buckets, 0.5)
+        p99 = bucket_quantile(buckets, 0.99)
+        stages[stage] = {
+            "count": int(count),
+            "mean_ms": round((data["sum"] - prev["sum"]) / count * 1000, 3),
+            # Histogram bucket upper bounds, not exact percentiles
+            "p50_ms_le": None if p50 is None else p50 * 1000,
+            "p99_ms_le": None if p99 is None else p99 * 1000,
+        }
+    return stages
+
+
+def scrape_all(args):
+    scraped = {}
+    for name, url in (
+        ("backend", f"{args.api_url}/metrics"),
+        ("worker", args.worker_metrics_url),
+    ):
+        if not url:
+            continue
+        try:
+            scraped[name] = scrape_histograms(url)
+        except Exception as e:
+            print(f"Could not scrape {name} metrics from {url}: {e}")
+    return scraped
+
+
+def run_http_level(args, inputs, concurrency):
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+    work = queue.Queue()
+    for item in inputs:
+        work.put(item)
+
+    def client():
+        while True:
+            try:
+                _, path, content_type = work.get_nowait()
+            except queue.Empty:
+                return
+
+            started = time.perf_counter()
+            ok = False
+            try:
+                task_id = post_file(args.api_url, path, content_type)["task_id"]
+                deadline = started + args.timeout
+                while time.perf_counter() < deadline:
+                    result = get_json(f"{args.api_url}/results/{task_id}")
+                    if result.get("status") == "completed":
+                        ok = "error" not in result
+                        break
+                    time.sleep(args.poll_interval)
+            except Exception as e:
+                print(f"Request failed: {e}")
+
+            elapsed = time.perf_counter() - started
+            with lock:
+                (latencies if ok else failures).append(elapsed)
+
+    wall_started = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    wall = time.perf_counter() - wall_started
+
+    return latencies, failures, wall
+
+
+def run_http(args, inputs):
+    levels = []
+    for concurrency in args.concurrency:
+        before = scrape_all(args)
+        latencies, failures, wall = run_http_level(args, inputs, concurrency)
+        after = scrape_all(args)
+
+        level = build_level(concurrency, latencies, failures, wall)
+        level["stages"] = {
+            name: diff_histograms(before.get(name, {}), after[name]) for name in after
+        }
+        levels.append(level)
+        print_level(level)
+
+    return levels
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+
+def build_level(concurrency, latencies, failures, wall):
+    completed = len(latencies)
+    return {
+        "concurrency": concurrency,
+        "completed": completed,
+        "failed": len(failures),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(completed / wall, 3) if wall > 0 else 0,
+        "latency": summarize_ms(latencies),
+    }
+
+
+def print_level(level):
+    latency = level["latency"]
+    line = (
+        f"concurrency={level['concurrency']:<3} "
+        f"completed={level['completed']:<4} failed={level['failed']:<3} "
+        f"throughput={level['throughput_rps']:.2f}/s "
+        f"p50={latency.get('p50_ms', 0):.1f}ms p99={latency.get('p99_ms', 0):.1f}ms"
+    )
+    if "peak_rss_kb" in level:
+        line += (
+            f" peak_rss={level['peak_rss_kb'] // 1024}MiB"
+            f" ({level['peak_rss_scope']})"
+        )
+    print(line, file=sys.__stdout__)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the upload -> queue -> worker -> result path."
+    )
+    parser.add_argument("--mode", choices=["inmemory", "http"], default="inmemory")
+    parser.add_argument(
+        "--input", choices=["image", "video", "mixed"], default="image"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=32, help="Requests per concurrency level"
+    )
+    parser.add_argument(
+        "--concurrency",
+        default="1,2,4,8",
+        help="Comma-separated list of client concurrency levels",
+    )
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=300.0,
+        help="Seconds to wait for a task before counting it as failed",
+    )
+
+    inmemory = parser.add_argument_group("inmemory mode")
+    inmemory.add_argument("--model", default=os.getenv("YOLO_MODEL", "yolov8n.pt"))
+    inmemory.add_argument(
+        "--stub-model",
+        action="store_true",
+        help="Replace YOLO with a stub so no weights are needed",
+    )
+    inmemory.add_argument("--stub-latency-ms", type=float, default=20.0)
+    inmemory.add_argument("--stub-per-frame-ms", type=float, default=5.0)
+    inmemory.add_argument("--worker-concurrency", type=int, default=4)
+    inmemory.add_argument("--max-batch", type=int, default=8)
+    inmemory.add_argument("--max-wait-ms", type=float, default=10.0)
+    inmemory.add_argument(
+        "--trace-memory",
+        choices=["auto", "always", "never"],
+        default="auto",
+        help="Record per-stage memory with tracemalloc; 'auto' only does so "
+        "at concurrency 1, since tracing slows things down",
+    )
+    inmemory.add_argument(
+        "--verbose", action="store_true", help="Show worker log output"
+    )
+
+    http = parser.add_argument_group("http mode")
+    http.add_argument("--api-url", default="http://localhost/api")
+    http.add_argument("--worker-metrics-url", default=None)
+    http.add_argument("--poll-interval", type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+    args.api_url = args.api_url.rstrip("/")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    inputs = pick_inputs(args.input, args.requests)
+
+    if args.mode == "http":
+        levels = run_http(args, inputs)
+    else:
+        levels = run_inmemory(args, inputs)
+
+    config = {
+        key: value
+        for key, value in vars(args).items()
+        if key not in ("output", "verbose")
+    }
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+        "levels": levels,
+    }
+
+    report_json = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report_json + "\n")
+        print(f"Wrote report to {args.output}")
+    else:
+        print(report_json)
+
+    if any(level.get("timed_out") for level in levels):
+        # Worker threads stuck on timed-out tasks would otherwise block
+        # interpreter shutdown
+        sys.stdout.flush()
+        os._exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+In-memory stand-ins for the YOLO model, MinIO and RabbitMQ.
+
+Shared by the benchmark's inmemory mode and the test suite so worker.py
+can run without weights or services.
+"""
+
+import threading
+import time
+import types
+
+
+class StubYOLO:
+    """
+    Drop-in replacement for ultralytics.YOLO that returns a fixed detection.
+
+    Sleeps for latency_ms per batch plus per_frame_ms per frame to roughly
+    mimic a CPU forward pass.
+    """
+
+    names = {0: "person", 20: "elephant", 22: "zebra"}
+
+    latency_ms = 0.0
+    per_frame_ms = 0.0
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+
+    def __call__(self, source, conf=0.25, **kwargs):
+        import numpy as np
+
+        frames = source if isinstance(source, list) else [source]
+        time.sleep((self.latency_ms + self.per_frame_ms * len(frames)) / 1000.0)
+
+        results = []
+        for frame in frames:
+            height, width = frame.shape[:2]
+            box = types.SimpleNamespace(
+                cls=np.array([22.0]),
+                conf=np.array([0.9]),
+                xyxy=np.array(
+                    [[width * 0.25, height * 0.25, width * 0.75, height * 0.75]]
+                ),
+            )
+            results.append(types.SimpleNamespace(boxes=[box]))
+        return results
+
+
+class FakeObject:
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return self._data
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class FakeMinio:
+    """Thread-safe in-memory stand-in for the subset of Minio we use."""
+
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def bucket_exists(self, bucket_name):
+        return True
+
+    def make_bucket(self, bucket_name):
+        pass
+
+    def put_object(self, bucket_name, object_name, data, length, content_type=None):
+        payload = data.read(length)
+        with self._lock:
+            self._objects[(bucket_name, object_name)] = payload
+
+    def get_object(self, bucket_name, object_name):
+        with self._lock:
+            if (bucket_name, object_name) not in self._objects:
+                raise KeyError(object_name)
+            return FakeObject(self._objects[(bucket_name, object_name)])
+
+    def has_object(self, bucket_name, object_name):
+        with self._lock:
+            return (bucket_name, object_name) in self._objects
+
+    def remove_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._objects if key[1].startswith(prefix)]:
+                del self._objects[key]
+
+
+class FakeConnection:
+    def add_callback_threadsafe(self, callback):
+        callback()
+
+
+class FakeChannel:
+    """
+    In-memory broker channel.
+
+    Acks and nacks resolve the matching pending delivery so the client
+    thread that published it can stop its latency clock.
+    """
+
+    def __init__(self):
+        self.connection = FakeConnection()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._next_tag = 0
+
+    def register(self):
+        with self._lock:
+            self._next_tag += 1
+            tag = self._next_tag
+            self._pending[tag] = {"event": threading.Event(), "ok": False}
+            return tag, self._pending[tag]
+
+    def _resolve(self, delivery_tag, ok):
+        with self._lock:
+            entry = self._pending.pop(delivery_tag)
+        entry["ok"] = ok
+        entry["event"].set()
+
+    def basic_ack(self, delivery_tag):
+        self._resolve(delivery_tag, True)
+
+    def basic_nack(self, delivery_tag, requeue=False):
+        self._resolve(delivery_tag, False)
@@ -0,0 +1,58 @@
+"""
+Shared fixtures for importing worker/worker.py without weights or services.
+
+The worker is imported once per session with the stub model from
+benchmark/fakes.py. The stub ultralytics module and the sys.path entries
+are only installed for the duration of that import, so they do not leak
+into other test modules; worker.py keeps its own reference to the stub.
+worker.py registers Prometheus metrics at import time, so it cannot be
+imported a second time in the same process.
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.join(ROOT_DIR, "benchmark")
+WORKER_DIR = os.path.join(ROOT_DIR, "worker")
+
+
+@pytest.fixture(scope="session")
+def fakes():
+    with pytest.MonkeyPatch.context() as mp:
+        mp.syspath_prepend(BENCHMARK_DIR)
+        import fakes
+
+        mp.delitem(sys.modules, "fakes")
+    return fakes
+
+
+@pytest.fixture(scope="session")
+def worker_module(fakes):
+    pytest.importorskip("cv2")
+    pytest.importorskip("prometheus_client")
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.syspath_prepend(WORKER_DIR)
+        mp.setitem(
+            sys.modules, "ultralytics", types.SimpleNamespace(YOLO=fakes.StubYOLO)
+        )
+        import worker
+
+        mp.delitem(sys.modules, "worker")
+    return worker
+
+
+@pytest.fixture
+def worker(worker_module, fakes, monkeypatch):
+    """The worker module with a fresh in-memory MinIO for each test."""
+    monkeypatch.setattr(worker_module, "minio_client", fakes.FakeMinio())
+    return worker_module
+
+
+@pytest.fixture
+def fake_minio(worker):
+    return worker.minio_client
@@ -0,0 +1,157 @@
+"""
+Tests for the reduced-size JPEG decode path in worker/worker.py.
+
+The worker runs with the stub model and in-memory MinIO from
+benchmark/fakes.py (see conftest.py). The stub reports one box covering
+the middle half of whatever frame it is given.
+"""
+
+import struct
+
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def decode_flags(monkeypatch):
+    """Record the flags every cv2.imdecode call is made with."""
+    flags = []
+    imdecode = cv2.imdecode
+
+    def spy(buf, flag):
+        flags.append(flag)
+        return imdecode(buf, flag)
+
+    monkeypatch.setattr(cv2, "imdecode", spy)
+    return flags
+
+
+def make_image(width, height, ext=".jpg"):
+    image = np.zeros((height, width, 3), np.uint8)
+    cv2.rectangle(
+        image, (width // 4, height // 4), (width // 2, height // 2), (0, 255, 0), -1
+    )
+    return cv2.imencode(ext, image)[1].tobytes()
+
+
+def with_exif_orientation(jpeg, orientation):
+    """Insert an APP1 EXIF segment carrying only an Orientation tag."""
+    tiff = (
+        b"MM\x00\x2a\x00\x00\x00\x08"
+        + struct.pack(">H", 1)
+        + struct.pack(">HHIHH", 0x0112, 3, 1, orientation, 0)
+        + struct.pack(">I", 0)
+    )
+    payload = b"Exif\x00\x00" + tiff
+    segment = b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+    return jpeg[:2] + segment + jpeg[2:]
+
+
+def annotated_shape(worker, result):
+    data = worker.minio_client.get_object(
+        worker.BUCKET_NAME, result["annotated_image"]
+    ).read()
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR).shape
+
+
+def test_get_jpeg_dimensions_reads_header(worker):
+    assert worker.get_jpeg_dimensions(make_image(1234, 567)) == (1234, 567)
+
+
+@pytest.mark.parametrize(
+    "size, factor",
+    [((6000, 4000), 8), ((4000, 3000), 4), ((1920, 1080), 2), ((800, 600), 1)],
+)
+def test_choose_decode_reduction(worker, size, factor):
+    assert worker.choose_decode_reduction(*size) == factor
+
+
+def test_large_jpeg_is_reduced_and_boxes_use_original_coordinates(
+    worker, decode_flags
+):
+    result = worker.run_yolo_detection_image(make_image(6000, 4000), "big")
+
+    assert decode_flags == [cv2.IMREAD_REDUCED_COLOR_8]
+    assert result["image_dimensions"] == {"width": 6000, "height": 4000}
+    assert result["detections"][0]["bbox"] == {
+        "x1": 1500.0,
+        "y1": 1000.0,
+        "x2": 4500.0,
+        "y2": 3000.0,
+    }
+    assert annotated_shape(worker, result) == (500, 750, 3)
+
+
+def test_exif_orientation_is_read_from_header(worker):
+    jpeg = make_image(4000, 2400)
+
+    assert worker.get_jpeg_dimensions(with_exif_orientation(jpeg, 6)) == (2400, 4000)
+    assert worker.get_jpeg_dimensions(with_exif_orientation(jpeg, 3)) == (4000, 2400)
+
+
+def test_exif_rotated_jpeg_reports_swapped_dimensions(worker, decode_flags):
+    # Stored landscape, displayed portrait (orientation 6 = rotate 90 CW)
+    jpeg = with_exif_orientation(make_image(4000, 2400), 6)
+
+    result = worker.run_yolo_detection_image(jpeg, "rotated")
+
+    assert decode_flags == [cv2.IMREAD_REDUCED_COLOR_4]
+    assert result["image_dimensions"] == {"width": 2400, "height": 4000}
+    assert result["detections"][0]["bbox"] == {
+        "x1": 600.0,
+        "y1": 1000.0,
+        "x2": 1800.0,
+        "y2": 3000.0,
+    }
+
+
+def test_near_square_portrait_without_exif_keeps_its_dimensions(
+    worker, decode_flags
+):
+    # 3999x4000 and 4000x3999 both decode to 1000x1000 at 1/4 scale
+    result = worker.run_yolo_detection_image(make_image(3999, 4000), "square")
+
+    assert decode_flags == [cv2.IMREAD_REDUCED_COLOR_4]
+    assert result["image_dimensions"] == {"width": 3999, "height": 4000}
+    assert result["detections"][0]["bbox"]["y1"] == 1000.0
+
+
+def test_png_falls_back_to_full_decode(worker, decode_flags):
+    png = make_image(3000, 2000, ext=".png")
+
+    assert worker.get_jpeg_dimensions(png) is None
+    result = worker.run_yolo_detection_image(png, "png")
+
+    assert decode_flags == [cv2.IMREAD_COLOR]
+    assert result["image_dimensions"] == {"width": 3000, "height": 2000}
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"\xff\xd8not a jpeg at all",
+        b"\xff\xd8\xff\xe0\x00\x10JFIF",  # segment runs past the end
+        make_image(3000, 2000)[:20],  # cut off before the SOF header
+    ],
+)
+def test_truncated_or_garbage_jpeg_falls_back_to_full_decode(
+    worker, data, decode_flags
+):
+    assert worker.get_jpeg_dimensions(data) is None
+
+    result = worker.run_yolo_detection_image(data, "garbage")
+
+    assert decode_flags == [cv2.IMREAD_COLOR]
+    assert result["error"] == "Failed to decode image"
+
+
+def test_full_resolution_annotates_full_size_decode(worker, decode_flags):
+    result = worker.run_yolo_detection_image(
+        make_image(6000, 4000), "full", full_resolution=True
+    )
+
+    assert decode_flags == [cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_COLOR]
+    assert result["detections"][0]["bbox"]["x2"] == 4500.0
+    assert annotated_shape(worker, result) == (4000, 6000, 3)
@@ -0,0 +1,160 @@
+"""
+Tests for InferenceScheduler and batched video processing in worker/worker.py.
+
+Each scheduler test builds its own InferenceScheduler around a fake model
+that records the size of every batch it is given.
+"""
+
+import threading
+import time
+import types
+
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+FRAME = np.zeros((8, 8, 3), np.uint8)
+
+
+class RecordingModel:
+    """Fake model that records batch sizes and can be paused or made to fail."""
+
+    def __init__(self):
+        self.batch_sizes = []
+        self.release = threading.Event()
+        self.release.set()
+        self.started = threading.Event()
+        self.error = None
+        self.drop_last = False
+
+    def __call__(self, frames, **kwargs):
+        self.batch_sizes.append(len(frames))
+        self.started.set()
+        self.release.wait()
+        if self.error is not None:
+            raise self.error
+        results = [types.SimpleNamespace(boxes=None) for _ in frames]
+        return results[:-1] if self.drop_last else results
+
+
+def make_scheduler(worker, model, max_batch=8, max_wait_ms=10):
+    return worker.InferenceScheduler(model, max_batch, max_wait_ms)
+
+
+def pause_on_first_batch(scheduler, model):
+    """Start a batch and keep the model busy until model.release is set."""
+    model.release.clear()
+    first = scheduler.submit(FRAME)
+    assert model.started.wait(2)
+    return first
+
+
+def test_batch_is_cut_at_max_batch(worker):
+    model = RecordingModel()
+    scheduler = make_scheduler(worker, model, max_batch=2, max_wait_ms=200)
+
+    first = pause_on_first_batch(scheduler, model)
+    futures = [scheduler.submit(FRAME) for _ in range(5)]
+    model.release.set()
+
+    for future in [first] + futures:
+        future.result(timeout=2)
+    assert model.batch_sizes == [1, 2, 2, 1]
+
+
+def test_partial_batch_is_flushed_after_max_wait(worker):
+    model = RecordingModel()
+    scheduler = make_scheduler(worker, model, max_batch=8, max_wait_ms=50)
+
+    started = time.monotonic()
+    futures = [scheduler.submit(FRAME) for _ in range(3)]
+    for future in futures:
+        future.result(timeout=2)
+    elapsed = time.monotonic() - started
+
+    assert model.batch_sizes == [3]
+    assert 0.05 <= elapsed < 1.0
+
+
+def test_max_wait_counts_from_when_frames_arrived(worker):
+    model = RecordingModel()
+    scheduler = make_scheduler(worker, model, max_batch=8, max_wait_ms=300)
+
+    first = pause_on_first_batch(scheduler, model)
+    waiting = [scheduler.submit(FRAME) for _ in range(2)]
+    # Keep the model busy past the waiting frames' deadline
+    time.sleep(0.4)
+    released = time.monotonic()
+    model.release.set()
+
+    first.result(timeout=2)
+    for future in waiting:
+        future.result(timeout=2)
+
+    assert model.batch_sizes == [1, 2]
+    assert time.monotonic() - released < 0.2
+
+
+def test_model_exception_reaches_every_future(worker):
+    model = RecordingModel()
+    model.error = ValueError("model broke")
+    scheduler = make_scheduler(worker, model)
+
+    futures = [scheduler.submit(FRAME) for _ in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError) as excinfo:
+            future.result(timeout=2)
+        assert excinfo.value.failed_stage == "inference"
+
+    # The scheduler thread survives and serves the next batch
+    model.error = None
+    assert scheduler.submit(FRAME).result(timeout=2).boxes is None
+
+
+def test_short_model_results_do_not_block_callers(worker):
+    model = RecordingModel()
+    model.drop_last = True
+    scheduler = make_scheduler(worker, model)
+
+    futures = [scheduler.submit(FRAME) for _ in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="2 results for 3 frames"):
+            future.result(timeout=2)
+
+
+def brightness_model(frames, **kwargs):
+    """Report one zebra whose x1 is the mean brightness of the frame."""
+    results = []
+    for frame in frames:
+        box = types.SimpleNamespace(
+            cls=np.array([22.0]),
+            conf=np.array([0.9]),
+            xyxy=np.array([[float(frame.mean()), 0.0, 10.0, 10.0]]),
+        )
+        results.append(types.SimpleNamespace(boxes=[box]))
+    return results
+
+
+@pytest.mark.parametrize("frames_in_flight", [3, 6])
+def test_video_results_keep_frame_order_across_groups(
+    worker, monkeypatch, tmp_path, frames_in_flight
+):
+    # 2 fps, so every other frame is sampled: 20 sampled frames in groups of 3
+    path = str(tmp_path / "video.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 2, (32, 32))
+    for i in range(40):
+        writer.write(np.full((32, 32, 3), i * 5, np.uint8))
+    writer.release()
+
+    monkeypatch.setattr(worker, "INFERENCE_MAX_BATCH", 3)
+    monkeypatch.setattr(worker, "VIDEO_FRAMES_IN_FLIGHT", frames_in_flight)
+    monkeypatch.setattr(worker.scheduler, "model", brightness_model)
+
+    with open(path, "rb") as f:
+        result = worker.run_yolo_detection_video(f.read(), "video")
+
+    frames = [entry["frame"] for entry in result["detections"]]
+    assert frames == list(range(0, 40, 2))
+    for entry in result["detections"]:
+        assert abs(entry["detections"][0]["bbox"]["x1"] - entry["frame"] * 5) < 3
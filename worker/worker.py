@@ -1,14 +1,20 @@
+import functools
 import io
 import json
 import os
+import queue
 import tempfile
+import threading
 import time
 from base64 import b64encode
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 
 import cv2
 import numpy as np
 import pika
 from minio import Minio
+from prometheus_client import Counter, Histogram, start_http_server
 from ultralytics import YOLO
 
 # Configuration
@@ -25,6 +31,84 @@ MODEL_PATH = os.getenv(
     "YOLO_MODEL", "yolov8n.pt"
 )  # Use yolov8n for speed, yolov8s/m/l/x for accuracy
 CONFIDENCE_THRESHOLD = float(os.getenv("CONFIDENCE_THRESHOLD", "0.5"))
+INFERENCE_IMAGE_SIZE = int(os.getenv("INFERENCE_IMAGE_SIZE", "640"))
+
+# Large JPEGs are decoded at 1/2, 1/4 or 1/8 scale when that still leaves at
+# least INFERENCE_IMAGE_SIZE pixels on the long side. Annotated images are
+# then drawn on the reduced image unless full resolution is requested.
+ANNOTATE_FULL_RESOLUTION = (
+    os.getenv("ANNOTATE_FULL_RESOLUTION", "false").lower() == "true"
+)
+
+# Micro-batching Configuration
+# Frames from concurrently processed tasks are grouped into a single forward
+# pass of up to INFERENCE_MAX_BATCH frames, waiting at most
+# INFERENCE_MAX_WAIT_MS for a batch to fill up.
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "8"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "10"))
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))
+
+# Maximum decoded video frames a single task keeps in memory while they wait
+# for inference. Each is a full-resolution frame (~25 MB for 4K), and up to
+# WORKER_CONCURRENCY videos can be processed at once.
+VIDEO_FRAMES_IN_FLIGHT = int(os.getenv("VIDEO_FRAMES_IN_FLIGHT", "8"))
+
+# Port for the Prometheus metrics server
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Prometheus Metrics
+STAGE_SECONDS = Histogram(
+    "wildlife_worker_stage_seconds",
+    "Time spent in each processing stage",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+TASK_SECONDS = Histogram(
+    "wildlife_worker_task_seconds",
+    "Total time to process a task, from delivery to ack",
+    ["file_type"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+BATCH_SIZE = Histogram(
+    "wildlife_worker_inference_batch_size",
+    "Number of frames per inference batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+SCHEDULER_WAIT_SECONDS = Histogram(
+    "wildlife_worker_inference_queue_wait_seconds",
+    "Time a frame waits in the inference scheduler before its batch runs",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+DETECTIONS = Counter(
+    "wildlife_worker_detections_total",
+    "Wildlife detections per class",
+    ["class_name"],
+)
+FAILURES = Counter(
+    "wildlife_worker_failures_total",
+    "Failed tasks per stage",
+    ["stage"],
+)
+
+
+@contextmanager
+def timed_stage(stage):
+    """
+    Record the duration of the enclosed block in STAGE_SECONDS.
+
+    Exceptions leaving the block are tagged with the stage (innermost wins)
+    so the task's failure can be counted against the stage that caused it.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        if not hasattr(e, "failed_stage"):
+            e.failed_stage = stage
+        raise
+    finally:
+        STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - started)
+
 
 # Initialize MinIO Client
 minio_client = Minio(
@@ -39,6 +123,136 @@ print(f"Loading YOLO model: {MODEL_PATH}")
 model = YOLO(MODEL_PATH)
 print("YOLO model loaded successfully!")
 
+
+class InferenceScheduler:
+    """
+    Shares model forward passes between concurrently processed tasks.
+
+    Frames are queued with submit() and picked up by a background thread,
+    which runs them through the model as one batch once either max_batch
+    frames are pending or max_wait_ms has passed since the first one arrived.
+    """
+
+    def __init__(self, model, max_batch, max_wait_ms):
+        self.model = model
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._frames = 0
+        self._largest_batch = 0
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+
+        self._thread = threading.Thread(
+            target=self._run, name="inference-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, frame):
+        """Queue a frame for inference and return a Future for its result."""
+        future = Future()
+        self._queue.put((frame, future, time.monotonic()))
+        return future
+
+    def infer(self, frame):
+        """Run inference on a single frame, blocking until it is done."""
+        return self.submit(frame).result()
+
+    def stats(self):
+        """Return a snapshot of batch-size and queue-wait metrics."""
+        with self._stats_lock:
+            batches = self._batches
+            return {
+                "batches": batches,
+                "frames": self._frames,
+                "avg_batch_size": round(self._frames / batches, 2) if batches else 0,
+                "max_batch_size": self._largest_batch,
+                "avg_queue_wait_ms": (
+                    round(self._queue_wait_total / self._frames * 1000, 2)
+                    if self._frames
+                    else 0
+                ),
+                "max_queue_wait_ms": round(self._queue_wait_max * 1000, 2),
+            }
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        # Frames that piled up during the previous batch don't wait again
+        deadline = batch[0][2] + self.max_wait
+
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Past the deadline: only take frames already queued
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _record_batch(self, batch, started):
+        BATCH_SIZE.observe(len(batch))
+        for _, _, queued_at in batch:
+            SCHEDULER_WAIT_SECONDS.observe(started - queued_at)
+
+        with self._stats_lock:
+            self._batches += 1
+            self._frames += len(batch)
+            self._largest_batch = max(self._largest_batch, len(batch))
+            for _, _, queued_at in batch:
+                wait = started - queued_at
+                self._queue_wait_total += wait
+                self._queue_wait_max = max(self._queue_wait_max, wait)
+
+    def _run_batch(self, batch):
+        started = time.monotonic()
+        self._record_batch(batch, started)
+
+        frames = [frame for frame, _, _ in batch]
+        with timed_stage("inference"):
+            results = list(
+                self.model(
+                    frames, conf=CONFIDENCE_THRESHOLD, imgsz=INFERENCE_IMAGE_SIZE
+                )
+            )
+
+        if len(results) != len(batch):
+            raise RuntimeError(
+                f"Model returned {len(results)} results for {len(batch)} frames"
+            )
+
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                batch = self._collect_batch()
+                self._run_batch(batch)
+            except Exception as e:
+                # Never leave a caller blocked on a future, and keep the
+                # scheduler thread alive for the next batch. The failure is
+                # counted by each task that receives the exception.
+                if not hasattr(e, "failed_stage"):
+                    e.failed_stage = "inference"
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+scheduler = InferenceScheduler(model, INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT_MS)
+
+# Thread pool for processing several queue messages at once, so their frames
+# can share batches in the scheduler
+executor = ThreadPoolExecutor(max_workers=WORKER_CONCURRENCY)
+
 # Wildlife animal classes from COCO dataset that YOLO can detect
 # These are the animal classes we want to filter for
 WILDLIFE_CLASSES = {
@@ -94,6 +308,48 @@ def is_wildlife_animal(class_name):
     return class_name.lower() in WILDLIFE_CLASSES
 
 
+def extract_detections(result):
+    """
+    Convert a single YOLO result into wildlife detection dictionaries.
+
+    Args:
+        result: ultralytics Results object for one image/frame
+
+    Returns:
+        List of detection dictionaries with class, confidence, bbox
+    """
+    detections = []
+    boxes = result.boxes
+    if boxes is None:
+        return detections
+
+    for box in boxes:
+        cls_id = int(box.cls[0])
+        class_name = model.names[cls_id]
+        confidence = float(box.conf[0])
+        bbox = box.xyxy[0].tolist()  # [x1, y1, x2, y2]
+
+        # Only include wildlife animals
+        if not is_wildlife_animal(class_name):
+            continue
+
+        DETECTIONS.labels(class_name=class_name).inc()
+        detections.append(
+            {
+                "class": class_name,
+                "confidence": round(confidence, 2),
+                "bbox": {
+                    "x1": round(bbox[0], 2),
+                    "y1": round(bbox[1], 2),
+                    "x2": round(bbox[2], 2),
+                    "y2": round(bbox[3], 2),
+                },
+            }
+        )
+
+    return detections
+
+
 # Color palette for bounding boxes (BGR format for OpenCV)
 COLORS = [
     (255, 0, 0),  # Blue
@@ -114,6 +370,25 @@ def get_color_for_class(class_name):
     return COLORS[hash(class_name) % len(COLORS)]
 
 
+def scale_detections(detections, scale_x, scale_y):
+    """Return a copy of detections with bounding boxes scaled by the given factors."""
+    scaled = []
+    for det in detections:
+        bbox = det["bbox"]
+        scaled.append(
+            {
+                **det,
+                "bbox": {
+                    "x1": round(bbox["x1"] * scale_x, 2),
+                    "y1": round(bbox["y1"] * scale_y, 2),
+                    "x2": round(bbox["x2"] * scale_x, 2),
+                    "y2": round(bbox["y2"] * scale_y, 2),
+                },
+            }
+        )
+    return scaled
+
+
 def draw_bounding_boxes(image, detections):
     """
     Draw bounding boxes and labels on the image.
@@ -187,40 +462,160 @@ def save_annotated_image_to_minio(image, task_id, suffix="annotated"):
         Object name in MinIO
     """
     # Encode image as JPEG
-    _, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
-    image_bytes = buffer.tobytes()
+    with timed_stage("annotation_encode"):
+        _, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        image_bytes = buffer.tobytes()
 
     object_name = f"annotated/{task_id}_{suffix}.jpg"
 
-    minio_client.put_object(
-        BUCKET_NAME,
-        object_name,
-        io.BytesIO(image_bytes),
-        length=len(image_bytes),
-        content_type="image/jpeg",
-    )
+    with timed_stage("annotation_upload"):
+        minio_client.put_object(
+            BUCKET_NAME,
+            object_name,
+            io.BytesIO(image_bytes),
+            length=len(image_bytes),
+            content_type="image/jpeg",
+        )
 
     return object_name
 
 
-def run_yolo_detection_image(image_data, task_id):
+# JPEG start-of-frame markers (SOF0-SOF15, excluding DHT, JPG and DAC)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+JPEG_APP1_MARKER = 0xE1
+
+# EXIF orientations that rotate the image by 90 degrees, swapping its sides
+EXIF_ORIENTATION_TAG = 0x0112
+EXIF_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+REDUCED_DECODE_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def read_exif_orientation(segment):
+    """
+    Read the Orientation tag from the payload of a JPEG APP1 segment.
+
+    Args:
+        segment: Bytes following the APP1 length field
+
+    Returns:
+        EXIF orientation (1-8), or 1 if the segment has none
+    """
+    if segment[:6] != b"Exif\x00\x00":
+        return 1
+
+    tiff = segment[6:]
+    byte_order = {b"II": "little", b"MM": "big"}.get(tiff[:2])
+    if byte_order is None or len(tiff) < 8:
+        return 1
+
+    ifd = int.from_bytes(tiff[4:8], byte_order)
+    if ifd + 2 > len(tiff):
+        return 1
+
+    for n in range(int.from_bytes(tiff[ifd : ifd + 2], byte_order)):
+        entry = ifd + 2 + n * 12
+        if entry + 12 > len(tiff):
+            break
+        if int.from_bytes(tiff[entry : entry + 2], byte_order) == EXIF_ORIENTATION_TAG:
+            return int.from_bytes(tiff[entry + 8 : entry + 10], byte_order)
+
+    return 1
+
+
+def get_jpeg_dimensions(data):
+    """
+    Read the displayed dimensions of a JPEG from its header without decoding it.
+
+    The EXIF orientation is taken into account the same way cv2.imdecode
+    applies it, so the result matches the shape of the decoded image.
+
+    Args:
+        data: Raw bytes of the image
+
+    Returns:
+        (width, height) tuple, or None if data is not a JPEG
+    """
+    if data[:2] != b"\xff\xd8":
+        return None
+
+    orientation = 1
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+
+        # Fill bytes and markers without a length field
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+
+        length = int.from_bytes(data[i + 2 : i + 4], "big")
+
+        if marker == JPEG_APP1_MARKER and orientation == 1:
+            orientation = read_exif_orientation(data[i + 4 : i + 2 + length])
+
+        if marker in JPEG_SOF_MARKERS:
+            height = int.from_bytes(data[i + 5 : i + 7], "big")
+            width = int.from_bytes(data[i + 7 : i + 9], "big")
+            if orientation in EXIF_TRANSPOSED_ORIENTATIONS:
+                return height, width
+            return width, height
+
+        i += 2 + length
+
+    return None
+
+
+def choose_decode_reduction(width, height):
+    """
+    Pick the largest JPEG decode reduction that keeps the long side at or
+    above INFERENCE_IMAGE_SIZE. Returns 1 if no reduction is possible.
+    """
+    long_side = max(width, height)
+    for factor in (8, 4, 2):
+        if long_side // factor >= INFERENCE_IMAGE_SIZE:
+            return factor
+    return 1
+
+
+def run_yolo_detection_image(image_data, task_id, full_resolution=False):
     """
     Run YOLO detection on an image.
 
     Args:
         image_data: Raw bytes of the image
         task_id: Task identifier for saving annotated image
+        full_resolution: Annotate the full-size image even when a reduced
+            JPEG decode was used for inference
 
     Returns:
         Dictionary with detection results
     """
     print("Running YOLO inference on image...")
 
+    # Decode large JPEGs at reduced size, since the model downsizes to
+    # INFERENCE_IMAGE_SIZE anyway
+    jpeg_dimensions = get_jpeg_dimensions(image_data)
+    reduction = choose_decode_reduction(*jpeg_dimensions) if jpeg_dimensions else 1
+
     # Convert bytes to numpy array
-    nparr = np.frombuffer(image_data, np.uint8)
-    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    with timed_stage("decode"):
+        nparr = np.frombuffer(image_data, np.uint8)
+        image = cv2.imdecode(
+            nparr, REDUCED_DECODE_FLAGS.get(reduction, cv2.IMREAD_COLOR)
+        )
 
     if image is None:
+        FAILURES.labels(stage="decode").inc()
         return {
             "detected": False,
             "type": "image",
@@ -230,44 +625,35 @@ def run_yolo_detection_image(image_data, task_id):
 
     # Get image dimensions
     height, width = image.shape[:2]
+    if reduction > 1:
+        width, height = jpeg_dimensions
 
-    # Run inference
-    results = model(image, conf=CONFIDENCE_THRESHOLD)
+    # Run inference (batched with frames from other in-flight tasks)
+    result = scheduler.infer(image)
 
-    detections = []
-    for result in results:
-        boxes = result.boxes
-        if boxes is not None:
-            for box in boxes:
-                cls_id = int(box.cls[0])
-                class_name = model.names[cls_id]
-                confidence = float(box.conf[0])
-                bbox = box.xyxy[0].tolist()  # [x1, y1, x2, y2]
-
-                # Only include wildlife animals
-                if not is_wildlife_animal(class_name):
-                    continue
-
-                detections.append(
-                    {
-                        "class": class_name,
-                        "confidence": round(confidence, 2),
-                        "bbox": {
-                            "x1": round(bbox[0], 2),
-                            "y1": round(bbox[1], 2),
-                            "x2": round(bbox[2], 2),
-                            "y2": round(bbox[3], 2),
-                        },
-                    }
-                )
+    with timed_stage("postprocess"):
+        image_detections = extract_detections(result)
 
-    # Sort by confidence
-    detections.sort(key=lambda x: x["confidence"], reverse=True)
+        # Sort by confidence
+        image_detections.sort(key=lambda x: x["confidence"], reverse=True)
+
+        # Report boxes in original image coordinates
+        detections = image_detections
+        if reduction > 1:
+            detections = scale_detections(
+                image_detections, width / image.shape[1], height / image.shape[0]
+            )
 
     # Only draw bounding boxes and save annotated image if there are wildlife detections
     annotated_object_name = None
     if detections:
-        annotated_image = draw_bounding_boxes(image, detections)
+        if reduction > 1 and full_resolution:
+            with timed_stage("decode"):
+                image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            image_detections = detections
+
+        with timed_stage("annotation_draw"):
+            annotated_image = draw_bounding_boxes(image, image_detections)
         annotated_object_name = save_annotated_image_to_minio(
             annotated_image, task_id, "annotated"
         )
@@ -300,10 +686,12 @@ def run_yolo_detection_video(video_data, task_id):
         tmp_file.write(video_data)
         tmp_path = tmp_file.name
 
+    cap = None
     try:
         cap = cv2.VideoCapture(tmp_path)
 
         if not cap.isOpened():
+            FAILURES.labels(stage="decode").inc()
             return {
                 "detected": False,
                 "type": "video",
@@ -324,71 +712,84 @@ def run_yolo_detection_video(video_data, task_id):
         frame_count = 0
         frame_index = 0  # Index for naming saved frames
 
+        def collect_frame(frame, frame_number, index, future):
+            timestamp_sec = frame_number / fps if fps > 0 else frame_number
+            minutes = int(timestamp_sec // 60)
+            seconds = int(timestamp_sec % 60)
+            timestamp_str = f"{minutes:02d}:{seconds:02d}"
+
+            result = future.result()
+            with timed_stage("postprocess"):
+                frame_detections = extract_detections(result)
+
+            # Save annotated frame if there are detections
+            if frame_detections:
+                with timed_stage("annotation_draw"):
+                    annotated_frame = draw_bounding_boxes(frame, frame_detections)
+                annotated_frame_name = save_annotated_image_to_minio(
+                    annotated_frame, task_id, f"frame_{index:04d}"
+                )
+
+                all_detections.append(
+                    {
+                        "timestamp": timestamp_str,
+                        "timestamp_seconds": round(timestamp_sec, 2),
+                        "frame": frame_number,
+                        "detections": frame_detections,
+                        "annotated_frame": annotated_frame_name,
+                    }
+                )
+
+        # Sampled frames are read ahead in groups of up to INFERENCE_MAX_BATCH
+        # and submitted back to back so they share one batch. If
+        # VIDEO_FRAMES_IN_FLIGHT allows, the previous group is post-processed
+        # while the next one is being read and inferred.
+        group_size = max(1, min(INFERENCE_MAX_BATCH, VIDEO_FRAMES_IN_FLIGHT))
+        group = []
+        in_flight = []
+
+        def collect_in_flight():
+            nonlocal in_flight
+            for item in in_flight:
+                collect_frame(*item)
+            in_flight = []
+
+        def flush_group():
+            nonlocal group, in_flight
+            submitted = [
+                (frame, frame_number, index, scheduler.submit(frame))
+                for frame, frame_number, index in group
+            ]
+            collect_in_flight()
+            group, in_flight = [], submitted
+
         while True:
-            ret, frame = cap.read()
+            # Process only at specified intervals; grab() skips retrieving
+            # frames that are not analyzed. Grabs are timed separately so the
+            # decode stage only covers frames that are actually analyzed.
+            sampled = frame_count % frame_interval == 0
+            with timed_stage("video_grab"):
+                ret = cap.grab()
+            if ret and sampled:
+                with timed_stage("decode"):
+                    ret, frame = cap.retrieve()
             if not ret:
                 break
 
-            # Process only at specified intervals
-            if frame_count % frame_interval == 0:
-                timestamp_sec = frame_count / fps if fps > 0 else frame_count
-                minutes = int(timestamp_sec // 60)
-                seconds = int(timestamp_sec % 60)
-                timestamp_str = f"{minutes:02d}:{seconds:02d}"
-
-                # Run YOLO on this frame
-                results = model(frame, conf=CONFIDENCE_THRESHOLD)
-
-                frame_detections = []
-                for result in results:
-                    boxes = result.boxes
-                    if boxes is not None:
-                        for box in boxes:
-                            cls_id = int(box.cls[0])
-                            class_name = model.names[cls_id]
-                            confidence = float(box.conf[0])
-                            bbox = box.xyxy[0].tolist()
-
-                            # Only include wildlife animals
-                            if not is_wildlife_animal(class_name):
-                                continue
-
-                            frame_detections.append(
-                                {
-                                    "class": class_name,
-                                    "confidence": round(confidence, 2),
-                                    "bbox": {
-                                        "x1": round(bbox[0], 2),
-                                        "y1": round(bbox[1], 2),
-                                        "x2": round(bbox[2], 2),
-                                        "y2": round(bbox[3], 2),
-                                    },
-                                }
-                            )
-
-                # Save annotated frame if there are detections
-                annotated_frame_name = None
-                if frame_detections:
-                    annotated_frame = draw_bounding_boxes(frame, frame_detections)
-                    annotated_frame_name = save_annotated_image_to_minio(
-                        annotated_frame, task_id, f"frame_{frame_index:04d}"
-                    )
-
-                    all_detections.append(
-                        {
-                            "timestamp": timestamp_str,
-                            "timestamp_seconds": round(timestamp_sec, 2),
-                            "frame": frame_count,
-                            "detections": frame_detections,
-                            "annotated_frame": annotated_frame_name,
-                        }
-                    )
+            if sampled:
+                # Keep memory bounded by finishing the previous group first
+                if len(group) + len(in_flight) >= VIDEO_FRAMES_IN_FLIGHT:
+                    collect_in_flight()
 
+                group.append((frame, frame_count, frame_index))
                 frame_index += 1
+                if len(group) >= group_size:
+                    flush_group()
 
             frame_count += 1
 
-        cap.release()
+        flush_group()
+        collect_in_flight()
 
         # Summarize unique classes detected
         unique_classes = set()
@@ -409,11 +810,28 @@ def run_yolo_detection_video(video_data, task_id):
         }
 
     finally:
-        # Clean up temporary file
+        # Clean up capture and temporary file
+        if cap is not None:
+            cap.release()
         os.unlink(tmp_path)
 
 
-def callback(ch, method, properties, body):
+def run_on_connection(ch, func, **kwargs):
+    """
+    Schedule a channel operation on the connection's I/O thread.
+
+    pika connections are not thread-safe, so acks/nacks from the processing
+    threads have to be handed back to the thread running start_consuming().
+    """
+    try:
+        ch.connection.add_callback_threadsafe(functools.partial(func, **kwargs))
+    except pika.exceptions.AMQPError as e:
+        # Connection went away; the broker will redeliver the message
+        print(f"Could not schedule {func.__name__}: {e}")
+
+
+def process_message(ch, method, body):
+    started = time.perf_counter()
     try:
         message = json.loads(body)
         print(f" [x] Received task: {message['task_id']}")
@@ -422,25 +840,40 @@ def callback(ch, method, properties, body):
         task_id = message["task_id"]
         file_type = message.get("file_type", "image")
 
+        # Time between the backend publishing the task and us picking it up
+        enqueued_at = message.get("enqueued_at")
+        if enqueued_at is not None:
+            STAGE_SECONDS.labels(stage="queue_wait").observe(
+                max(0.0, time.time() - enqueued_at)
+            )
+
         # Download image/video from MinIO
         try:
-            response = minio_client.get_object(BUCKET_NAME, object_name)
-            data = response.read()
-            response.close()
-            response.release_conn()
+            with timed_stage("download"):
+                response = minio_client.get_object(BUCKET_NAME, object_name)
+                data = response.read()
+                response.close()
+                response.release_conn()
             print(
                 f"Downloaded {file_type} {object_name} from MinIO ({len(data)} bytes)"
             )
         except Exception as e:
             print(f"Error downloading file: {e}")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+            FAILURES.labels(stage="download").inc()
+            run_on_connection(ch, ch.basic_ack, delivery_tag=method.delivery_tag)
             return
 
         # Run YOLO Detection
         if file_type == "video":
             result = run_yolo_detection_video(data, task_id)
         else:
-            result = run_yolo_detection_image(data, task_id)
+            result = run_yolo_detection_image(
+                data,
+                task_id,
+                full_resolution=(
+                    message.get("full_resolution") or ANNOTATE_FULL_RESOLUTION
+                ),
+            )
 
         result["task_id"] = task_id
         result["original_filename"] = message["original_filename"]
@@ -453,27 +886,43 @@ def callback(ch, method, properties, body):
 
         result_object_name = f"results/{task_id}.json"
 
-        minio_client.put_object(
-            BUCKET_NAME,
-            result_object_name,
-            result_stream,
-            length=len(result_json),
-            content_type="application/json",
-        )
+        with timed_stage("result_upload"):
+            minio_client.put_object(
+                BUCKET_NAME,
+                result_object_name,
+                result_stream,
+                length=len(result_json),
+                content_type="application/json",
+            )
         print(f"Saved result to {result_object_name}")
 
-        ch.basic_ack(delivery_tag=method.delivery_tag)
-        print(" [x] Done")
+        run_on_connection(ch, ch.basic_ack, delivery_tag=method.delivery_tag)
+        TASK_SECONDS.labels(file_type=file_type).observe(
+            time.perf_counter() - started
+        )
+        print(f" [x] Done (inference scheduler: {scheduler.stats()})")
 
     except Exception as e:
         print(f"Error processing message: {e}")
+        FAILURES.labels(stage=getattr(e, "failed_stage", "processing")).inc()
         import traceback
 
         traceback.print_exc()
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        run_on_connection(
+            ch, ch.basic_nack, delivery_tag=method.delivery_tag, requeue=False
+        )
+
+
+def callback(ch, method, properties, body):
+    # Hand the message off so the connection thread can keep receiving
+    # deliveries (up to WORKER_CONCURRENCY at a time) while it is processed
+    executor.submit(process_message, ch, method, body)
 
 
 def main():
+    start_http_server(METRICS_PORT)
+    print(f"Metrics server listening on port {METRICS_PORT}")
+
     print("Worker started. Connecting to RabbitMQ...")
     while True:
         try:
@@ -483,7 +932,7 @@ def main():
             channel = connection.channel()
             channel.queue_declare(queue=QUEUE_NAME, durable=True)
 
-            channel.basic_qos(prefetch_count=1)
+            channel.basic_qos(prefetch_count=WORKER_CONCURRENCY)
             channel.basic_consume(queue=QUEUE_NAME, on_message_callback=callback)
 
             print(" [*] Waiting for messages. To exit press CTRL+C")